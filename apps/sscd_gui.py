@@ -1,51 +1,127 @@
+import asyncio
 import logging
-from equipment import LIA, PEM, Stepper, StepperCmd
+from equipment import LIA, PEM, Stepper
 from logzero import logger
 from pathlib import Path
-from tkinter import Tk, BOTH, TOP, LEFT, X
-from tkinter.ttk import Frame, Label, Entry
+from tkinter import Tk, BOTH, TOP, LEFT, X, messagebox
+from tkinter.ttk import Frame, Label, Entry, Button
 
 
 class App(Frame):
     def __init__(self):
         super().__init__()
+        self.lia = None
+        self.stepper = None
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        # the loop only holds weak references to tasks, so keep them until they finish
+        self._tasks = set()
         self.init_ui()
+        self._run_loop_once()
+
+    def _run_loop_once(self):
+        # let asyncio handle whatever is ready, then hand control back to Tk
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+        self.after(10, self._run_loop_once)
 
     def init_ui(self):
         self.master.title("MHz Steady State CD")
         self.pack(fill=BOTH, expand=1)
         port_frame = Frame(self, borderwidth=1)
-        # PEM port
-        pem_port_frame = Frame(port_frame)
-        pem_port_frame.pack(fill=X)
-        pem_port_label = Label(pem_port_frame, text="PEM Port", width=12)
-        pem_port_label.pack(side=LEFT, padx=5, pady=5)
-        pem_port_entry = Entry(pem_port_frame)
-        pem_port_entry.pack(fill=X, padx=5, expand=True)
-        # Stepper port
-        stepper_port_frame = Frame(port_frame)
-        stepper_port_frame.pack(fill=X)
-        stepper_port_label = Label(stepper_port_frame, text="Stepper Port", width=12)
-        stepper_port_label.pack(side=LEFT, padx=5, pady=5)
-        stepper_port_entry = Entry(stepper_port_frame)
-        stepper_port_entry.pack(fill=X, padx=5, expand=True)
-        # LIA port
-        lia_port_frame = Frame(port_frame)
-        lia_port_frame.pack(fill=X)
-        lia_port_label = Label(lia_port_frame, text="LIA Port", width=12)
-        lia_port_label.pack(side=LEFT, padx=5, pady=5)
-        lia_port_entry = Entry(lia_port_frame)
-        lia_port_entry.pack(fill=X, padx=5, expand=True)
-
+        self._entries = {}
+        for label_text in ("PEM Port", "Stepper Port", "LIA Port"):
+            row = Frame(port_frame)
+            row.pack(fill=X)
+            Label(row, text=label_text, width=12).pack(side=LEFT, padx=5, pady=5)
+            entry = Entry(row)
+            entry.pack(fill=X, padx=5, expand=True)
+            self._entries[label_text] = entry
         port_frame.pack(fill=BOTH, expand=True)
+        # Stepper move
+        move_frame = Frame(self)
+        move_frame.pack(fill=X)
+        move_label = Label(move_frame, text="Target", width=12)
+        move_label.pack(side=LEFT, padx=5, pady=5)
+        self.target_entry = Entry(move_frame, width=10)
+        self.target_entry.pack(side=LEFT, padx=5)
+        move_button = Button(move_frame, text="Move", command=self.start_move)
+        move_button.pack(side=LEFT, padx=5)
+        self.pos_label = Label(self, text="Position: ?")
+        self.pos_label.pack(fill=X, padx=5, pady=5)
+        # Sample
+        sample_frame = Frame(self)
+        sample_frame.pack(fill=X)
+        sample_button = Button(sample_frame, text="Sample", command=self.take_sample)
+        sample_button.pack(side=LEFT, padx=5)
+        self.sample_label = Label(sample_frame, text="X = ?")
+        self.sample_label.pack(side=LEFT, padx=5, pady=5)
+
+    def _open_stepper(self):
+        if self.stepper is None:
+            self.stepper = Stepper(self._entries["Stepper Port"].get())
+
+    def _open_lia(self):
+        if self.lia is None:
+            self.lia = LIA(self._entries["LIA Port"].get(), ["X", "R", "XN", "IN3"])
+
+    def _run(self, coro):
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._on_task_done)
+
+    def _on_task_done(self, task):
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            logger.error("[GUI] background task failed: %s", exc, exc_info=exc)
+            # this runs inside the asyncio loop, and a modal dialog would re-enter it
+            # through _run_loop_once, so let Tk show it once the loop has handed back
+            self.after_idle(messagebox.showerror, "Error", str(exc))
+
+    def start_move(self):
+        self._open_stepper()
+        self._run(self._start_move(int(self.target_entry.get())))
+
+    async def _start_move(self, target_pos):
+        # go through the stepper's executor so the port is never used by two threads at once
+        await self.stepper.start_move_async(target_pos)
+        self.after(50, self._on_poll)
+
+    def _on_poll(self):
+        self._run(self._poll())
+
+    async def _poll(self):
+        # one position query per tick keeps the window responsive while the stage moves
+        done, pos = await self.stepper.poll_move_async()
+        self.pos_label.configure(text=f"Position: {pos}")
+        if not done:
+            self.after(50, self._on_poll)
+
+    async def sample(self):
+        # the LIA and stepper are on separate ports, so wait on both at once
+        return await asyncio.gather(self.lia.read_all_async(), self.stepper.pos_async())
+
+    def take_sample(self):
+        self._open_lia()
+        self._open_stepper()
+        self._run(self._show_sample())
+
+    async def _show_sample(self):
+        (x, r, xn, in3), pos = await self.sample()
+        logger.debug("sampled X=%s, R=%s, XN=%s, IN3=%s at %s", x, r, xn, in3, pos)
+        self.sample_label.configure(text=f"X = {x:.3e} at {pos}")
 
 
 
 def main():
     root = Tk()
-    root.geometry("250x150+300+300")
+    root.geometry("250x240+300+300")
     app = App()
     root.mainloop()
+    app.loop.close()
 
 
 if __name__ == "__main__":
@@ -1,140 +1,177 @@
+import logging
 from serial import Serial
 from logzero import logger
+from serial_io import ReplySync, port_executor, read_line, run_blocking
+
+
+_CMD_REF_SOURCE = b"RSRC EXT\n"
+_CMD_INPUT_MODE = b"IVMD VOLT\n"
+_CMD_INPUT_COUPLING = b"ICPL AC\n"
+_CMD_VOLTAGE_INPUT = b"ISRC A\n"
+_CMD_GROUNDING = b"IGND FLO\n"
+# _CMD_TIME_CONSTANT = b"OFLT 12\n"  # 1s
+_CMD_TIME_CONSTANT = b"OFLT 10\n"  # 100ms
+_CMD_FILTER_6DB = b"OFSL 0\n"
+# the LIA accepts several newline-terminated commands in one write
+_CMD_CONFIG = (
+    _CMD_REF_SOURCE
+    + _CMD_GROUNDING
+    + _CMD_INPUT_MODE
+    + _CMD_INPUT_COUPLING
+    + _CMD_VOLTAGE_INPUT
+    + _CMD_TIME_CONSTANT
+    + _CMD_FILTER_6DB
+)
+_CMD_IDN = b"*IDN?\n"
+_CMD_APHS = b"APHS\n"
+_CMD_AC = b"OUTP? X\n"
+_CMD_NOISE = b"OUTP? XN\n"
+_CMD_R = b"OUTP? R\n"
+_CMD_DC = b"OUTP? IN3\n"
+_CMD_SNAP = b"SNAPD?\n"
+_EXPECTED_IDN = b"Stanford_Research_Systems,SR865A,003263,V1.47"
 
 
 class LIA:
     def __init__(self, port, channels):
-        self.ser = Serial(port, 115200, 8, 'N', 1, timeout=5)
+        self.ser = Serial(port, 115200, 8, 'N', 1, timeout=0.1, inter_byte_timeout=0.05)
         logger.info(f"[LIA] opened {port} for LIA")
+        self._executor = port_executor()
+        self._sync = ReplySync(self.ser, "[LIA]")
         self.channels = channels
-        self._set_data_channels()
-        self._set_ref_source()
-        self._set_grounding_mode()
-        self._set_input_mode()
-        self._set_input_coupling()
-        self._set_voltage_input_mode()
-        self._set_time_constant()
-        self.filter_6db()
-
-    def _set_data_channels(self):
-        for i, channel in enumerate(self.channels):
-            cmd = f"CDSP DAT{i+1},{channel}\n".encode("utf-8")
-            logger.debug(f"[LIA] setting data channel {i} to {channel}: {cmd}")
-            self.ser.write(cmd)
-
-    def _set_ref_source(self):
-        cmd = b"RSRC EXT\n"
-        logger.debug(f"[LIA] setting external reference: {cmd}")
+        cmd = self._data_channel_cmds() + _CMD_CONFIG
+        logger.debug("[LIA] setting data channels to %s and configuring inputs: %s", channels, cmd)
         self.ser.write(cmd)
 
-    def _set_input_mode(self):
-        cmd = b"IVMD VOLT\n"
-        logger.debug(f"[LIA] setting input mode to voltage: {cmd}")
-        self.ser.write(b"IVMD VOLT\n")
-
-    def _set_input_coupling(self):
-        cmd = b"ICPL AC\n"
-        logger.debug(f"[LIA] setting AC input coupling: {cmd}")
-        self.ser.write(cmd)
-
-    def _set_voltage_input_mode(self):
-        cmd = b"ISRC A\n"
-        logger.debug(f"[LIA] setting voltage input to A: {cmd}")
-        self.ser.write(cmd)
+    def _data_channel_cmds(self):
+        return b"".join(f"CDSP DAT{i+1},{ch}\n".encode() for i, ch in enumerate(self.channels))
 
-    def _set_grounding_mode(self):
-        cmd = b"IGND FLO\n"
-        logger.debug(f"[LIA] setting grounding mode to float: {cmd}")
+    def _set_data_channels(self):
+        cmd = self._data_channel_cmds()
+        logger.debug("[LIA] setting data channels to %s: %s", self.channels, cmd)
         self.ser.write(cmd)
 
     def is_connected(self):
         logger.debug("[LIA] checking whether LIA is connected")
         logger.debug("[LIA] resetting input buffer")
         self.ser.reset_input_buffer()
-        cmd = b"*IDN?\n"
-        logger.debug(f"[LIA] getting LIA identification: {cmd}")
+        self._sync.out_of_step = False
+        cmd = _CMD_IDN
+        logger.debug("[LIA] getting LIA identification: %s", cmd)
         self.ser.write(cmd)
-        response = self.ser.read_until(size=45)
-        logger.debug(f"[LIA] received response: (bytes) {response} (text) {response.decode()}")
-        if response.decode() != "Stanford_Research_Systems,SR865A,003263,V1.47":
+        # read through the CRLF terminator so the queries below start in step
+        response = read_line(self.ser)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[LIA] received response: (bytes) %s (text) %s", response, response.decode())
+        if not response.endswith(b"\n"):
+            self._sync.mark()
+        if response.rstrip(b"\r\n") != _EXPECTED_IDN:
             logger.debug("[LIA] did not receive expected response, not connected")
             return False
         logger.debug("[LIA] received expected response, is connected")
         return True
 
-    def _set_time_constant(self):
-        # code = 12  # 1s
-        code = 10  # 100ms
-        cmd = f"OFLT {code}\n".encode('utf-8')
-        logger.debug(f"[LIA] setting time constant: {cmd}")
-        self.ser.write(cmd)
-
     def filter_6db(self):
-        cmd = b"OFSL 0\n"
-        logger.debug(f"[LIA] setting 6db filter slope: {cmd}")
+        cmd = _CMD_FILTER_6DB
+        logger.debug("[LIA] setting 6db filter slope: %s", cmd)
         self.ser.write(cmd)
 
     def auto_phase(self):
-        cmd = b"APHS\n"
-        logger.debug(f"[LIA] setting phase with auto-phase: {cmd}")
+        cmd = _CMD_APHS
+        logger.debug("[LIA] setting phase with auto-phase: %s", cmd)
         self.ser.write(cmd)
 
     def ac(self):
         logger.debug("[LIA] getting AC value")
-        logger.debug("[LIA] resetting input buffer")
-        self.ser.reset_input_buffer()
-        cmd = b"OUTP? X\n"
-        logger.debug(f"[LIA] querying AC value: {cmd}")
+        cmd = _CMD_AC
+        logger.debug("[LIA] querying AC value: %s", cmd)
+        self._sync.before_query()
         self.ser.write(cmd)
-        response_bytes = self.ser.read_until()  # read until newline
-        response_str = response_bytes.decode()
-        logger.debug(f"[LIA] received response: (bytes) {response_bytes} (text) {response_str}")
-        return response_str
+        response_bytes = read_line(self.ser)
+        logger.debug("[LIA] received response: %s", response_bytes)
+        if not response_bytes.endswith(b"\n"):
+            self._sync.mark()
+            raise ValueError(f"sent {cmd}, got {response_bytes}")
+        return float(response_bytes)
 
     def noise(self):
         logger.debug("[LIA] getting noise value")
-        logger.debug("[LIA] resetting input buffer")
-        self.ser.reset_input_buffer()
-        cmd = b"OUTP? XN\n"
-        logger.debug(f"[LIA] querying noise value: {cmd}")
+        cmd = _CMD_NOISE
+        logger.debug("[LIA] querying noise value: %s", cmd)
+        self._sync.before_query()
         self.ser.write(cmd)
-        response_bytes = self.ser.read_until()  # read until newline
-        response_str = response_bytes.decode()
-        logger.debug(f"[LIA] received response: (bytes) {response_bytes} (text) {response_str}")
-        return response_str
+        response_bytes = read_line(self.ser)
+        logger.debug("[LIA] received response: %s", response_bytes)
+        if not response_bytes.endswith(b"\n"):
+            self._sync.mark()
+            raise ValueError(f"sent {cmd}, got {response_bytes}")
+        return float(response_bytes)
 
     def signal_mag(self):
         logger.debug("[LIA] getting signal magnitude (R) value")
-        logger.debug("[LIA] resetting input buffer")
-        self.ser.reset_input_buffer()
-        cmd = b"OUTP? R\n"
-        logger.debug(f"[LIA] querying signal magnitude value: {cmd}")
+        cmd = _CMD_R
+        logger.debug("[LIA] querying signal magnitude value: %s", cmd)
+        self._sync.before_query()
         self.ser.write(cmd)
-        response_bytes = self.ser.read_until()  # read until newline
-        response_str = response_bytes.decode()
-        logger.debug(f"[LIA] received response: (bytes) {response_bytes} (text) {response_str}")
-        return response_str
+        response_bytes = read_line(self.ser)
+        logger.debug("[LIA] received response: %s", response_bytes)
+        if not response_bytes.endswith(b"\n"):
+            self._sync.mark()
+            raise ValueError(f"sent {cmd}, got {response_bytes}")
+        return float(response_bytes)
 
     def dc(self):
         logger.debug("[LIA] getting DC value")
-        logger.debug("[LIA] resetting input buffer")
-        self.ser.reset_input_buffer()
-        cmd = b"OUTP? IN3\n"
-        logger.debug(f"[LIA] querying DC value: {cmd}")
+        cmd = _CMD_DC
+        logger.debug("[LIA] querying DC value: %s", cmd)
+        self._sync.before_query()
         self.ser.write(cmd)
-        response_bytes = self.ser.read_until()  # read until newline
-        response_str = response_bytes.decode()
-        logger.debug(f"[LIA] received response: (bytes) {response_bytes} (text) {response_str}")
-        return response_str
+        response_bytes = read_line(self.ser)
+        logger.debug("[LIA] received response: %s", response_bytes)
+        if not response_bytes.endswith(b"\n"):
+            self._sync.mark()
+            raise ValueError(f"sent {cmd}, got {response_bytes}")
+        return float(response_bytes)
 
     def data_snapshot(self):
         logger.debug("[LIA] getting snapshot values")
-        logger.debug("[LIA] resetting input buffer")
-        self.ser.reset_input_buffer()
-        cmd = b"SNAPD?\n"
-        logger.debug(f"[LIA] querying snapshot values: {cmd}")
+        cmd = _CMD_SNAP
+        logger.debug("[LIA] querying snapshot values: %s", cmd)
+        self._sync.before_query()
         self.ser.write(cmd)
-        response_bytes = self.ser.read_until(b"\r")  # read until newline
-        response_str = response_bytes.decode()
-        logger.debug(f"[LIA] received response: (bytes) {response_bytes} (text) {response_str}")
-        return response_str
+        # replies end in CRLF, stopping at the CR would leave the LF for the next query
+        response_bytes = read_line(self.ser)
+        logger.debug("[LIA] received response: %s", response_bytes)
+        if not response_bytes.endswith(b"\n"):
+            self._sync.mark()
+            raise ValueError(f"sent {cmd}, got {response_bytes}")
+        return [float(x) for x in response_bytes.rstrip(b"\r\n").split(b",")]
+
+    def configure_snap(self, params):
+        # SNAPD? reports whatever the data channels display, so routing the
+        # wanted parameters to them lets one query replace several OUTP?s
+        logger.debug("[LIA] configuring snapshot parameters: %s", params)
+        self.channels = params
+        self._set_data_channels()
+
+    def read_all(self):
+        logger.debug("[LIA] reading all data channels")
+        return tuple(self.data_snapshot())
+
+    async def ac_async(self):
+        return await run_blocking(self._executor, self.ac)
+
+    async def noise_async(self):
+        return await run_blocking(self._executor, self.noise)
+
+    async def signal_mag_async(self):
+        return await run_blocking(self._executor, self.signal_mag)
+
+    async def dc_async(self):
+        return await run_blocking(self._executor, self.dc)
+
+    async def data_snapshot_async(self):
+        return await run_blocking(self._executor, self.data_snapshot)
+
+    async def read_all_async(self):
+        return await run_blocking(self._executor, self.read_all)
@@ -1,6 +1,7 @@
 import serial
 from serial import Serial
 from logzero import logger
+from serial_io import ReplySync, port_executor, read_exactly, run_blocking
 
 
 class PEM:
@@ -9,49 +10,51 @@ class PEM:
             "baudrate": 2400,
             "bytesize": serial.EIGHTBITS,
             "stopbits": serial.STOPBITS_ONE,
-            "timeout": 5,
+            "timeout": 0.1,
+            "inter_byte_timeout": 0.05,
         }
         self.ser = Serial(port, **params)
         logger.info(f"[PEM] opened {port} for PEM")
+        self._executor = port_executor()
+        self._sync = ReplySync(self.ser, "[PEM]")
 
     def set_wl(self, wl_str):
         cmd = f"W:{wl_str}\r\n".encode("utf-8")
-        logger.debug(f"[PEM] setting wavelength: {cmd}")
-        self.ser.reset_input_buffer()
+        logger.debug("[PEM] setting wavelength: %s", cmd)
+        self._sync.before_query()
         self.ser.write(cmd)
-        resp = self.ser.read(3)
-        logger.debug(f"[PEM] received response: {resp}")
+        resp = read_exactly(self.ser, 3)
+        logger.debug("[PEM] received response: %s", resp)
         if resp != b"\n\r*":
             logger.error(f"[PEM] received response {resp}, expected '\\n\\r*'")
+            self._sync.mark()
             raise ValueError(f"sent {cmd}, got {resp}")
 
     def enable_ret(self):
-        cmd = b"I:0\r\n"  # enable retardation
-        logger.debug(f"[PEM] enabling retardation: {cmd}")
-        self.ser.reset_input_buffer()
+        # enable retardation and set it to a quarter wave in one write, the
+        # PEM acknowledges each command in turn
+        cmd = b"I:0\r\nR:0250\r\n"
+        logger.debug("[PEM] enabling quarter wave retardation: %s", cmd)
+        self._sync.before_query()
         self.ser.write(cmd)
-        resp = self.ser.read(3)
-        logger.debug(f"[PEM] received response: {cmd}")
-        if resp != b"\n\r*":
-            logger.error(f"[PEM] received response {resp}, expected '\\n\\r*'")
-            raise ValueError(f"sent {cmd}, got {resp}")
-        cmd = b"R:0250\r\n"  # quarter wave retardation
-        logger.debug(f"[PEM] setting retardation: {cmd}")
-        self.ser.reset_input_buffer()
-        self.ser.write(cmd)
-        resp = self.ser.read(3)
-        logger.debug(f"[PEM] received response: {cmd}")
-        if resp != b"\n\r*":
-            logger.error(f"[PEM] received response {resp}, expected '\\n\\r*'")
+        resp = read_exactly(self.ser, 6)
+        logger.debug("[PEM] received response: %s", resp)
+        if resp != b"\n\r*\n\r*":
+            logger.error(f"[PEM] received response {resp}, expected '\\n\\r*\\n\\r*'")
+            self._sync.mark()
             raise ValueError(f"sent {cmd}, got {resp}")
 
     def disable_ret(self):
         cmd = b"I:1\r\n"
-        logger.debug(f"[PEM] disabling retardation: {cmd}")
-        self.ser.reset_input_buffer()
+        logger.debug("[PEM] disabling retardation: %s", cmd)
+        self._sync.before_query()
         self.ser.write(cmd)
-        resp = self.ser.read(3)
-        logger.debug(f"[PEM] received response: {cmd}")
+        resp = read_exactly(self.ser, 3)
+        logger.debug("[PEM] received response: %s", resp)
         if resp != b"\n\r*":
             logger.error(f"[PEM] received response {resp}, expected '\\n\\r*'")
+            self._sync.mark()
             raise ValueError(f"sent {cmd}, got {resp}")
+
+    async def set_wl_async(self, wl_str):
+        return await run_blocking(self._executor, self.set_wl, wl_str)
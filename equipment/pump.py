@@ -1,45 +1,48 @@
 from logzero import logger
 from serial import Serial
 import sys
+from serial_io import port_executor, read_exactly, read_line, run_blocking
+
 
 class Pump:
     def __init__(self, port_name):
         self.ser = Serial(port_name,
-                          timeout=5,
+                          timeout=0.1,
+                          inter_byte_timeout=0.05,
                           baudrate=115_200,)
         logger.info(f"[PUMP] opened {port_name} for pump")
+        self._executor = port_executor()
 
     def turn_on(self):
         msg = b"ON\n"
-        logger.debug(f"[PUMP] turning the power on: {msg}")
+        logger.debug("[PUMP] turning the power on: %s", msg)
         self.ser.write(msg)
 
     def turn_off(self):
         msg = b"OFF\n"
-        logger.debug(f"[PUMP] turning the power off: {msg}")
+        logger.debug("[PUMP] turning the power off: %s", msg)
         self.ser.write(msg)
 
     def open_shutter(self):
         msg = b"SHT:1\n"
-        logger.debug(f"[PUMP] opening the shutter: {msg}")
+        logger.debug("[PUMP] opening the shutter: %s", msg)
         self.ser.write(msg)
 
     def close_shutter(self):
         msg = b"SHT:0\n"
-        logger.debug(f"[PUMP] closing the shutter: {msg}")
+        logger.debug("[PUMP] closing the shutter: %s", msg)
         self.ser.write(msg)
 
     def set_power(self, watts):
         msg = f"P:{watts}\n".encode("utf-8")
-        logger.debug(f"[PUMP] setting the pump power: {msg}")
+        logger.debug("[PUMP] setting the pump power: %s", msg)
         self.ser.write(msg)
 
     def diode_is_on(self):
         msg = b"?D\n"
-        logger.debug(f"[PUMP] querying diode power state: {msg}")
-        self.ser.reset_input_buffer()
+        logger.debug("[PUMP] querying diode power state: %s", msg)
         self.ser.write(msg)
-        resp = self.ser.read(2)
+        resp = read_exactly(self.ser, 2)
         if (resp != b"1\n") and (resp != b"0\n"):
             logger.error(f"[PUMP] received response {resp}, expected b'1\\n' or b'0\\n'")
             sys.exit(1)
@@ -52,10 +55,9 @@ class Pump:
 
     def shutter_is_open(self):
         msg = b"?SHT\n"
-        logger.debug(f"[PUMP] querying shutter state: {msg}")
-        self.ser.reset_input_buffer()
+        logger.debug("[PUMP] querying shutter state: %s", msg)
         self.ser.write(msg)
-        resp = self.ser.read(2)
+        resp = read_exactly(self.ser, 2)
         if (resp != b"1\n") and (resp != b"0\n"):
             logger.error(f"[PUMP] received response {resp}, expected b'1\\n' or b'0\\n'")
             sys.exit(1)
@@ -68,14 +70,16 @@ class Pump:
 
     def current_power(self):
         msg = b"?P\n"
-        logger.debug(f"[PUMP] querying diode output power: {msg}")
-        self.ser.reset_input_buffer()
+        logger.debug("[PUMP] querying diode output power: %s", msg)
         self.ser.write(msg)
-        resp = self.ser.read_until()
+        resp = read_line(self.ser)
         resp_data = resp.decode().strip()
         if not resp_data.isdecimal():
             logger.error(f"[PUMP] received {resp_data}, expected float 0<=f<=5.0")
             sys.exit(1)
         power = float(resp_data)
-        logger.debug(f"[PUMP] the output power is {power:.3f}")
+        logger.debug("[PUMP] the output power is %.3f", power)
         return power
+
+    async def current_power_async(self):
+        return await run_blocking(self._executor, self.current_power)
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logzero import logger
+
+
+def read_exactly(ser, n, timeout=1.0):
+    # a single read() can return early with only part of a reply, so keep
+    # reading until all n bytes are in or the deadline passes
+    buf = bytearray()
+    end = time.monotonic() + timeout
+    while len(buf) < n and time.monotonic() < end:
+        buf += ser.read(n - len(buf))
+    return bytes(buf)
+
+
+def read_line(ser, terminator=b"\n", timeout=1.0):
+    # the port timeout is kept short, so read_until() can give up before a
+    # slower reply is complete; keep reading until the terminator arrives
+    # or the overall deadline passes
+    buf = bytearray()
+    end = time.monotonic() + timeout
+    while not buf.endswith(terminator) and time.monotonic() < end:
+        buf += ser.read_until(terminator)
+    return bytes(buf)
+
+
+def drain(ser, tag):
+    # replies are read in full, so anything left over means the device got out
+    # of step and the rest must not be mistaken for the next reply; keep
+    # discarding until the port stays quiet for a whole timeout, since queries
+    # can follow each other immediately and the rest may not be in yet
+    logger.debug("%s draining input buffer", tag)
+    ser.reset_input_buffer()
+    while ser.read(1):
+        ser.reset_input_buffer()
+
+
+class ReplySync:
+    # a reply that fails may have been cut short with the rest still on its
+    # way, so the port is only marked out of step then, and drained just
+    # before the next query so the late remainder is discarded too
+    def __init__(self, ser, tag):
+        self.ser = ser
+        self.tag = tag
+        self.out_of_step = False
+
+    def mark(self):
+        self.out_of_step = True
+
+    def before_query(self):
+        if self.out_of_step:
+            drain(self.ser, self.tag)
+            self.out_of_step = False
+
+
+def port_executor():
+    # one worker per port, so that traffic to the device never interleaves
+    # even when several coroutines are waiting on it at once
+    return ThreadPoolExecutor(max_workers=1)
+
+
+async def run_blocking(executor, func, *args):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, func, *args)
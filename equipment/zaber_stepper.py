@@ -1,7 +1,15 @@
 import struct
+import time
 from enum import Enum
 from serial import Serial
 from logzero import logger
+from serial_io import ReplySync, port_executor, run_blocking
+
+
+# packets are device number, command number, then a signed 32-bit value
+_PKT = struct.Struct("<BBl")
+# replies carry a signed 32-bit little-endian value after device and command
+_POS_UNPACK = struct.Struct("<i").unpack_from
 
 
 class StepperCmd(Enum):
@@ -10,40 +18,132 @@ class StepperCmd(Enum):
     GETPOS = 60
 
 
+# the stage only ever answers MOVE and GETPOS here
+_REPLY_CMDS = (StepperCmd.MOVE.value, StepperCmd.GETPOS.value)
+
+
 class Stepper:
     def __init__(self, port):
-        self.ser = Serial(port, 9600, 8, 'N', 1, timeout=5)
+        self.ser = Serial(port, 9600, 8, 'N', 1, timeout=1.0, inter_byte_timeout=0.05)
         logger.info(f"[STEP] opened {port} for stepper")
         self.device = 1
+        self._getpos_pkt = _PKT.pack(self.device, StepperCmd.GETPOS.value, 0)
+        # last known position, shared by callers polling within the same 50 ms
+        self._pos_cache_val = None
+        self._pos_cache_t = 0.0
+        # target of the move in progress, None when the stage is idle
+        self._target = None
+        self._executor = port_executor()
+        self._sync = ReplySync(self.ser, "[STEP]")
 
     def _send(self, cmd, data):
-        packet = struct.pack("<BBl", self.device, cmd, data)
-        logger.debug(f"[STEP] sending packet: {packet}")
+        packet = _PKT.pack(self.device, cmd, data)
+        logger.debug("[STEP] sending packet: %s", packet)
         self.ser.write(packet)
 
     def _recv(self):
         response = self.ser.read(6)
-        logger.debug(f"[STEP] received response: {response}")
+        logger.debug("[STEP] received response: %s", response)
         return response
 
-    def move(self, target_pos):
-        logger.debug(f"[STEP] moving to {target_pos}")
+    def _is_reply(self, resp):
+        # a full-length read can still straddle two packets once the port is
+        # out of step, so check the device and command bytes as well
+        return len(resp) == 6 and resp[0] == self.device and resp[1] in _REPLY_CMDS
+
+    def start_move(self, target_pos):
+        logger.debug("[STEP] moving to %s", target_pos)
         self._send(StepperCmd.MOVE.value, target_pos)
-        logger.debug(f"[STEP] waiting until the destination is reached")
-        curr_pos = 0
-        while curr_pos != target_pos:
-            curr_pos = self.pos()
-            logger.debug(f"[STEP] still moving ({curr_pos} / {target_pos})")
+        self._target = target_pos
+        self._pos_cache_val = None
+
+    def poll_move(self):
+        if self._target is None:
+            logger.debug("[STEP] no move in progress")
+            return True, self.pos()
+        # after a cut-short reply the bytes waiting can't be trusted to line up with packets
+        self._sync.before_query()
+        if self.ser.in_waiting >= 6:
+            # the stage replies to MOVE once the move has finished
+            resp = self._recv()
+            if not self._is_reply(resp):
+                self._sync.mark()
+                return False, self._pos_cache_val
+            curr_pos = _POS_UNPACK(resp, 2)[0]
+            self._pos_cache_val = curr_pos
+            self._pos_cache_t = time.monotonic()
+        else:
+            try:
+                curr_pos = self.pos(force=True)
+            except ValueError as e:
+                # pos() has marked the port out of step, the next poll drains it and asks again
+                logger.debug("[STEP] position poll failed: %s", e)
+                return False, self._pos_cache_val
+            if curr_pos == self._target:
+                # one reply is still owed (MOVE or GETPOS, whichever pos() didn't read)
+                if not self._is_reply(self._recv()):
+                    self._sync.mark()
+        logger.debug("[STEP] at %s / %s", curr_pos, self._target)
+        done = curr_pos == self._target
+        if done:
+            self._target = None
+        return done, curr_pos
+
+    def move(self, target_pos):
+        self.start_move(target_pos)
+        logger.debug("[STEP] waiting until the destination is reached")
+        # the stage replies to MOVE once the move has finished
+        resp = self._recv()
+        if self._is_reply(resp):
+            curr_pos = _POS_UNPACK(resp, 2)[0]
+            self._pos_cache_val = curr_pos
+            self._pos_cache_t = time.monotonic()
+            if curr_pos == target_pos:
+                self._target = None
+                logger.debug("[STEP] done moving")
+                return
+            logger.debug("[STEP] move reply gave %s, expected %s", curr_pos, target_pos)
+        elif resp:
+            # the rest of the reply would shift every packet after it
+            logger.debug("[STEP] malformed move reply (%s), polling position", resp)
+            self._sync.mark()
+        else:
+            logger.debug("[STEP] no move reply before the timeout, polling position")
+        # bind the loop's lookups once rather than on every poll
+        poll = self.poll_move
+        sleep = time.sleep
+        done = False
+        while not done:
+            sleep(0.05)
+            done, curr_pos = poll()
         logger.debug("[STEP] done moving")
 
-    def pos(self):
-        logger.debug("[STEP] getting current position")
-        self._send(StepperCmd.GETPOS.value, 0)
+    def pos(self, force=False):
+        now = time.monotonic()
+        if not force and self._pos_cache_val is not None and now - self._pos_cache_t < 0.05:
+            return self._pos_cache_val
+        logger.debug("[STEP] getting current position: %s", self._getpos_pkt)
+        self._sync.before_query()
+        self.ser.write(self._getpos_pkt)
         resp = self._recv()
-        logger.debug(f"[STEP] received response: {resp}")
-        value = 256**3 * resp[5] + 256**2 * resp[4] + 256 * resp[3] + resp[2]
-        logger.debug(f"[STEP] translates to: {value}")
-        if resp[5] > 127:
-            value = -256**4
-            logger.debug(f"[STEP] setting value to {value}")
+        logger.debug("[STEP] received response: %s", resp)
+        if not self._is_reply(resp):
+            self._sync.mark()
+            raise ValueError(f"sent {self._getpos_pkt}, got {resp}")
+        value = _POS_UNPACK(resp, 2)[0]
+        logger.debug("[STEP] translates to: %s", value)
+        self._pos_cache_val = value
+        self._pos_cache_t = now
         return value
+
+    async def start_move_async(self, target_pos):
+        return await run_blocking(self._executor, self.start_move, target_pos)
+
+    async def poll_move_async(self):
+        return await run_blocking(self._executor, self.poll_move)
+
+    async def move_async(self, target_pos):
+        return await run_blocking(self._executor, self.move, target_pos)
+
+    async def pos_async(self):
+        return await run_blocking(self._executor, self.pos)
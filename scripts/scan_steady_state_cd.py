@@ -1,9 +1,11 @@
 import click
+import io
 import logging
 import logzero
 import numpy as np
 import struct
 import serial
+from bisect import bisect_left
 from enum import Enum
 from logzero import logger
 from math import floor
@@ -13,11 +15,18 @@ from time import time, sleep
 from ..equipment import LIA, PEM, Stepper
 
 
+# signal, noise and dc are written with ten significant digits each, instead of however
+# many digits repr() happens to produce for a given float
+_ROW_FMT = "%d,%.9e,%.9e,%.9e\n"
+
+
 class LIA:
-    def __init__(self, port, channels):
-        self.ser = Serial(port, 115200, 8, 'N', 1, timeout=5)
+    def __init__(self, port, channels, timeout=0.2):
+        self.ser = Serial(port, 115200, 8, 'N', 1, timeout=timeout)
         logger.info(f"[LIA] opened {port} for LIA")
         self.channels = channels
+        self._snapd_cmd = b"SNAPD?\n"
+        self._out_of_step = False
         self._set_data_channels()
         self._set_ref_source()
         self._set_grounding_mode()
@@ -30,32 +39,32 @@ class LIA:
     def _set_data_channels(self):
         for i, channel in enumerate(self.channels):
             cmd = f"CDSP DAT{i+1},{channel}\n".encode("utf-8")
-            logger.debug(f"[LIA] setting data channel {i} to {channel}: {cmd}")
+            logger.debug("[LIA] setting data channel %s to %s: %s", i, channel, cmd)
             self.ser.write(cmd)
 
     def _set_ref_source(self):
         cmd = b"RSRC EXT\n"
-        logger.debug(f"[LIA] setting external reference: {cmd}")
+        logger.debug("[LIA] setting external reference: %s", cmd)
         self.ser.write(cmd)
 
     def _set_input_mode(self):
         cmd = b"IVMD VOLT\n"
-        logger.debug(f"[LIA] setting input mode to voltage: {cmd}")
+        logger.debug("[LIA] setting input mode to voltage: %s", cmd)
         self.ser.write(b"IVMD VOLT\n")
 
     def _set_input_coupling(self):
         cmd = b"ICPL AC\n"
-        logger.debug(f"[LIA] setting AC input coupling: {cmd}")
+        logger.debug("[LIA] setting AC input coupling: %s", cmd)
         self.ser.write(cmd)
 
     def _set_voltage_input_mode(self):
         cmd = b"ISRC A\n"
-        logger.debug(f"[LIA] setting voltage input to A: {cmd}")
+        logger.debug("[LIA] setting voltage input to A: %s", cmd)
         self.ser.write(cmd)
 
     def _set_grounding_mode(self):
         cmd = b"IGND FLO\n"
-        logger.debug(f"[LIA] setting grounding mode to float: {cmd}")
+        logger.debug("[LIA] setting grounding mode to float: %s", cmd)
         self.ser.write(cmd)
 
     def is_connected(self):
@@ -63,10 +72,11 @@ class LIA:
         logger.debug("[LIA] resetting input buffer")
         self.ser.reset_input_buffer()
         cmd = b"*IDN?\n"
-        logger.debug(f"[LIA] getting LIA identification: {cmd}")
+        logger.debug("[LIA] getting LIA identification: %s", cmd)
         self.ser.write(cmd)
         response = self.ser.read_until(size=45)
-        logger.debug(f"[LIA] received response: (bytes) {response} (text) {response.decode()}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[LIA] received response: (bytes) %s (text) %s", response, response.decode())
         if response.decode() != "Stanford_Research_Systems,SR865A,003263,V1.47":
             logger.debug("[LIA] did not receive expected response, not connected")
             return False
@@ -77,17 +87,17 @@ class LIA:
         # code = 12  # 1s
         code = 10  # 100ms
         cmd = f"OFLT {code}\n".encode('utf-8')
-        logger.debug(f"[LIA] setting time constant: {cmd}")
+        logger.debug("[LIA] setting time constant: %s", cmd)
         self.ser.write(cmd)
 
     def filter_6db(self):
         cmd = b"OFSL 0\n"
-        logger.debug(f"[LIA] setting 6db filter slope: {cmd}")
+        logger.debug("[LIA] setting 6db filter slope: %s", cmd)
         self.ser.write(cmd)
 
     def auto_phase(self):
         cmd = b"APHS\n"
-        logger.debug(f"[LIA] setting phase with auto-phase: {cmd}")
+        logger.debug("[LIA] setting phase with auto-phase: %s", cmd)
         self.ser.write(cmd)
 
     def ac(self):
@@ -95,111 +105,119 @@ class LIA:
         logger.debug("[LIA] resetting input buffer")
         self.ser.reset_input_buffer()
         cmd = b"OUTP? X\n"
-        logger.debug(f"[LIA] querying AC value: {cmd}")
+        logger.debug("[LIA] querying AC value: %s", cmd)
         self.ser.write(cmd)
         response_bytes = self.ser.read_until()  # read until newline
-        response_str = response_bytes.decode()
-        logger.debug(f"[LIA] received response: (bytes) {response_bytes} (text) {response_str}")
-        return response_str
+        logger.debug("[LIA] received response: %s", response_bytes)
+        # float() parses bytes directly, so there's no need to decode first
+        return float(response_bytes)
 
     def noise(self):
         logger.debug("[LIA] getting noise value")
         logger.debug("[LIA] resetting input buffer")
         self.ser.reset_input_buffer()
         cmd = b"OUTP? XN\n"
-        logger.debug(f"[LIA] querying noise value: {cmd}")
+        logger.debug("[LIA] querying noise value: %s", cmd)
         self.ser.write(cmd)
         response_bytes = self.ser.read_until()  # read until newline
-        response_str = response_bytes.decode()
-        logger.debug(f"[LIA] received response: (bytes) {response_bytes} (text) {response_str}")
-        return response_str
+        logger.debug("[LIA] received response: %s", response_bytes)
+        return float(response_bytes)
 
     def signal_mag(self):
         logger.debug("[LIA] getting signal magnitude (R) value")
         logger.debug("[LIA] resetting input buffer")
         self.ser.reset_input_buffer()
         cmd = b"OUTP? R\n"
-        logger.debug(f"[LIA] querying signal magnitude value: {cmd}")
+        logger.debug("[LIA] querying signal magnitude value: %s", cmd)
         self.ser.write(cmd)
         response_bytes = self.ser.read_until()  # read until newline
-        response_str = response_bytes.decode()
-        logger.debug(f"[LIA] received response: (bytes) {response_bytes} (text) {response_str}")
-        return response_str
+        logger.debug("[LIA] received response: %s", response_bytes)
+        return float(response_bytes)
 
     def dc(self):
         logger.debug("[LIA] getting DC value")
         logger.debug("[LIA] resetting input buffer")
         self.ser.reset_input_buffer()
         cmd = b"OUTP? IN3\n"
-        logger.debug(f"[LIA] querying DC value: {cmd}")
+        logger.debug("[LIA] querying DC value: %s", cmd)
         self.ser.write(cmd)
         response_bytes = self.ser.read_until()  # read until newline
-        response_str = response_bytes.decode()
-        logger.debug(f"[LIA] received response: (bytes) {response_bytes} (text) {response_str}")
-        return response_str
+        logger.debug("[LIA] received response: %s", response_bytes)
+        return float(response_bytes)
 
     def data_snapshot(self):
-        logger.debug("[LIA] getting snapshot values")
-        logger.debug("[LIA] resetting input buffer")
+        # called as fast as possible while integrating, so only build log
+        # messages when they will actually be emitted
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("[LIA] getting snapshot values")
+            logger.debug("[LIA] querying snapshot values: %s", self._snapd_cmd)
+        if self._out_of_step:
+            self._drain()
+        self.ser.write(self._snapd_cmd)
+        # replies end in CRLF, stopping at the CR would leave the LF for the next query
+        response_bytes = self.ser.read_until()  # read until newline
+        if debug:
+            logger.debug("[LIA] received response: %s", response_bytes)
+        if (not response_bytes.endswith(b"\n")) or (response_bytes.count(b",") != len(self.channels) - 1):
+            self._out_of_step = True
+            raise ValueError(f"sent {self._snapd_cmd}, got {response_bytes}")
+        return response_bytes.rstrip(b"\r\n")
+
+    def _drain(self):
+        # only needed after a reply was cut short; snapshots are requested back to back,
+        # so wait for the port to go quiet for a whole timeout to discard a late remainder too
+        logger.debug("[LIA] draining input buffer")
         self.ser.reset_input_buffer()
-        cmd = b"SNAPD?\n"
-        logger.debug(f"[LIA] querying snapshot values: {cmd}")
-        self.ser.write(cmd)
-        response_bytes = self.ser.read_until(b"\r")  # read until newline
-        response_str = response_bytes.decode()
-        logger.debug(f"[LIA] received response: (bytes) {response_bytes} (text) {response_str}")
-        return response_str
+        while self.ser.read(1):
+            self.ser.reset_input_buffer()
+        self._out_of_step = False
 
 
 class PEM:
-    def __init__(self, port):
+    def __init__(self, port, timeout=0.5):
         params = {
             "baudrate": 2400,
             "bytesize": serial.EIGHTBITS,
             "stopbits": serial.STOPBITS_ONE,
-            "timeout": 5,
+            "timeout": timeout,
         }
         self.ser = Serial(port, **params)
         logger.info(f"[PEM] opened {port} for PEM")
 
     def set_wl(self, wl_str):
-        cmd = f"W:{wl_str}\r\n".encode("utf-8")
-        logger.debug(f"[PEM] setting wavelength: {cmd}")
+        self.set_wl_bytes(f"W:{wl_str}\r\n".encode("utf-8"))
+
+    def set_wl_bytes(self, cmd):
+        logger.debug("[PEM] setting wavelength: %s", cmd)
         self.ser.reset_input_buffer()
         self.ser.write(cmd)
         resp = self.ser.read(3)
-        logger.debug(f"[PEM] received response: {resp}")
+        logger.debug("[PEM] received response: %s", resp)
         if resp != b"\n\r*":
             logger.error(f"[PEM] received response {resp}, expected '\\n\\r*'")
             raise ValueError(f"sent {cmd}, got {resp}")
 
     def enable_ret(self):
-        cmd = b"I:0\r\n"  # enable retardation
-        logger.debug(f"[PEM] enabling retardation: {cmd}")
-        self.ser.reset_input_buffer()
-        self.ser.write(cmd)
-        resp = self.ser.read(3)
-        logger.debug(f"[PEM] received response: {cmd}")
-        if resp != b"\n\r*":
-            logger.error(f"[PEM] received response {resp}, expected '\\n\\r*'")
-            raise ValueError(f"sent {cmd}, got {resp}")
-        cmd = b"R:0250\r\n"  # quarter wave retardation
-        logger.debug(f"[PEM] setting retardation: {cmd}")
+        # enable retardation and set it to a quarter wave in one write, the
+        # PEM acknowledges each command in turn
+        cmd = b"I:0\r\nR:0250\r\n"
+        logger.debug("[PEM] enabling quarter wave retardation: %s", cmd)
         self.ser.reset_input_buffer()
         self.ser.write(cmd)
-        resp = self.ser.read(3)
-        logger.debug(f"[PEM] received response: {cmd}")
-        if resp != b"\n\r*":
-            logger.error(f"[PEM] received response {resp}, expected '\\n\\r*'")
+        resp = self.ser.read(6)
+        logger.debug("[PEM] received response: %s", resp)
+        if resp != b"\n\r*\n\r*":
+            logger.error(f"[PEM] received response {resp}, expected '\\n\\r*\\n\\r*'")
             raise ValueError(f"sent {cmd}, got {resp}")
 
     def disable_ret(self):
         cmd = b"I:1\r\n"
-        logger.debug(f"[PEM] disabling retardation: {cmd}")
+        logger.debug("[PEM] disabling retardation: %s", cmd)
         self.ser.reset_input_buffer()
         self.ser.write(cmd)
         resp = self.ser.read(3)
-        logger.debug(f"[PEM] received response: {cmd}")
+        logger.debug("[PEM] received response: %s", resp)
         if resp != b"\n\r*":
             logger.error(f"[PEM] received response {resp}, expected '\\n\\r*'")
             raise ValueError(f"sent {cmd}, got {resp}")
@@ -212,87 +230,130 @@ class StepperCmd(Enum):
 
 
 class Stepper:
-    def __init__(self, port):
-        self.ser = Serial(port, 9600, 8, 'N', 1, timeout=5)
+    def __init__(self, port, timeout=1):
+        self.ser = Serial(port, 9600, 8, 'N', 1, timeout=timeout)
         logger.info(f"[STEP] opened {port} for stepper")
         self.device = 1
+        self._out_of_step = False
 
     def _send(self, cmd, data):
         packet = struct.pack("<BBl", self.device, cmd, data)
-        logger.debug(f"[STEP] sending packet: {packet}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[STEP] sending packet: %s", packet)
         self.ser.write(packet)
 
     def _recv(self):
         response = self.ser.read(6)
-        logger.debug(f"[STEP] received response: {response}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[STEP] received response: %s", response)
         return response
 
     def move(self, target_pos):
-        logger.debug(f"[STEP] moving to {target_pos}")
+        logger.debug("[STEP] moving to %s", target_pos)
         self._send(StepperCmd.MOVE.value, target_pos)
-        logger.debug(f"[STEP] waiting until the destination is reached")
-        curr_pos = 0
-        while curr_pos != target_pos:
-            curr_pos = self.pos()
-            logger.debug(f"[STEP] still moving ({curr_pos} / {target_pos})")
+        logger.debug("[STEP] waiting until the destination is reached")
+        # a short timeout means a late reply costs one poll rather than a whole second,
+        # the next poll drains whatever is left of it and asks again
+        timeout = self.ser.timeout
+        self.ser.timeout = 0.05
+        try:
+            # pause between polls so GETPOS packets don't flood the 9600 baud link
+            while True:
+                sleep(0.05)
+                curr_pos = self._poll_pos()
+                if curr_pos == target_pos:
+                    break
+                logger.debug("[STEP] still moving (%s / %s)", curr_pos, target_pos)
+        finally:
+            self.ser.timeout = timeout
+        # the stage also replies to MOVE once it arrives, and one of the two replies
+        # is still owed, so read it now rather than leave it for the next caller
+        if not self._is_reply(self._recv()):
+            self._out_of_step = True
         logger.debug("[STEP] done moving")
 
-    def pos(self):
-        logger.debug("[STEP] getting current position")
+    def _is_reply(self, resp):
+        # a full-length read can still straddle two packets once the port is
+        # out of step, so check the device and command bytes as well
+        return (len(resp) == 6) and (resp[0] == self.device) and (resp[1] in (StepperCmd.MOVE.value, StepperCmd.GETPOS.value))
+
+    def _poll_pos(self):
+        if self._out_of_step:
+            self._drain()
         self._send(StepperCmd.GETPOS.value, 0)
         resp = self._recv()
-        logger.debug(f"[STEP] received response: {resp}")
-        value = 256**3 * resp[5] + 256**2 * resp[4] + 256 * resp[3] + resp[2]
-        logger.debug(f"[STEP] translates to: {value}")
-        if resp[5] > 127:
-            value = -256**4
-            logger.debug(f"[STEP] setting value to {value}")
+        if not self._is_reply(resp):
+            # the rest of the reply may still be on its way and would shift every packet
+            # after it, so it's drained before the next query rather than right now
+            logger.debug("[STEP] malformed position reply (%s), discarding it", resp)
+            self._out_of_step = True
+            return None
+        return struct.unpack_from("<i", resp, 2)[0]
+
+    def _drain(self):
+        # wait for the port to go quiet so that the rest of a late reply is discarded too
+        logger.debug("[STEP] draining input buffer")
+        self.ser.reset_input_buffer()
+        while self.ser.read(1):
+            self.ser.reset_input_buffer()
+        self._out_of_step = False
+
+    def pos(self):
+        # polled continuously while moving, so skip logging calls entirely unless debugging
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("[STEP] getting current position")
+        value = self._poll_pos()
+        if value is None:
+            raise ValueError("no position reply from the stepper")
+        if debug:
+            logger.debug("[STEP] translates to: %s", value)
         return value
 
 
+def pem_wl_cmd(wl):
+    # the PEM takes the wavelength in tenths of a nanometer, zero padded to five digits
+    return f"W:0{wl}0\r\n".encode("utf-8")
+
+
 def get_calibration_table(path):
     table = {
         "wl": [],
-        "wl_pem": [],
+        "pem_cmd": [],
         "pos": [],
     }
-    logger.debug(f"opening {path} to read calibration table")
+    logger.debug("opening %s to read calibration table", path)
     with open(path, "r") as file:
         for i, line in enumerate(file):
             wl_str, pos_str = line.strip().split(",")
             table["wl"].append(int(wl_str))
-            table["wl_pem"].append(f"0{wl_str}0")
+            table["pem_cmd"].append(pem_wl_cmd(int(wl_str)))
             table["pos"].append(int(pos_str))
     return table
 
 
-def scan_interpolated(lia, pem, stepper, table, output_path, integration_time=1, wl_offset=None):
+def scan_interpolated(lia, pem, stepper, table, output_path, integration_time=1, wl_offset=None, positions=None):
+    if positions is None:
+        positions = interpolate_positions(table, range(795, 851, 1))
+    offset = wl_offset or 0
+    pem_cmds = [pem_wl_cmd(wl + offset) for wl in positions]
     pem.enable_ret()
     with open(output_path, "w") as file:
         file.write("wl,signal,noise,dc\n")
-        for wl in range(795, 851, 1):
+        for (wl, pos), pem_cmd in zip(positions.items(), pem_cmds):
             logger.info(f"beginning collection for {wl}nm")
-            if wl_offset is not None:
-                wl_pem = f"0{wl + wl_offset}0"
-            else:
-                wl_pem = f"0{wl}0"
-            # pos = interpolate_wl(wl, table)
-            pos = interpolate_pos(table, wl)
-            logger.debug(f"interpolated position {pos} for wavelength {wl}nm")
+            logger.debug("interpolated position %s for wavelength %snm", pos, wl)
             stepper.move(pos)
-            pem.set_wl(wl_pem)
-            sleep(0.5)  # let the signal settle before adjusting the phase
+            pem.set_wl_bytes(pem_cmd)
+            wait_for_settle(lia)  # let the signal settle before adjusting the phase
             lia.auto_phase()
-            samples = []
             logger.info("integrating")
-            time_start = time()
-            while (time() - time_start) < integration_time:
-                samples.append(lia.data_snapshot())
+            samples = collect_samples(lia, integration_time)
             logger.info("processing samples")
             signal, noise, dc = average_samples(samples)
-            result_line = f"{wl},{signal},{noise},{dc}\n"
-            logger.debug(f"writing line to result file: {result_line}")
-            file.write(result_line)
+            row = _ROW_FMT % (wl, signal, noise, dc)
+            logger.debug("writing row to result file: %s", row)
+            file.write(row)
         logger.debug("sending the stepper to initial position")
         stepper.move(table["pos"][0]-2000)
     logger.debug("sending the stepper to initial position")
@@ -302,88 +363,111 @@ def scan_interpolated(lia, pem, stepper, table, output_path, integration_time=1,
 def scan(lia, pem, stepper, table, output_path, integration_time=1):
     pem.enable_ret()
     with open(output_path, "w") as file:
-        for wl, wl_pem, pos in zip(table["wl"], table["wl_pem"], table["pos"]):
+        for wl, pem_cmd, pos in zip(table["wl"], table["pem_cmd"], table["pos"]):
             logger.info(f"beginning collection for {wl}nm")
             stepper.move(pos)
-            pem.set_wl(wl_pem)
-            sleep(0.5)  # let the signal settle before adjusting the phase
+            pem.set_wl_bytes(pem_cmd)
+            wait_for_settle(lia)  # let the signal settle before adjusting the phase
             lia.auto_phase()
-            samples = []
             logger.info("integrating")
-            time_start = time()
-            while (time() - time_start) < integration_time:
-                samples.append(lia.data_snapshot())
+            samples = collect_samples(lia, integration_time)
             logger.info("processing samples")
             signal, noise, dc = average_samples(samples)
-            result_line = f"{wl},{signal},{noise},{dc}\n"
-            logger.debug(f"writing line to result file: {result_line}")
-            file.write(result_line)
+            row = _ROW_FMT % (wl, signal, noise, dc)
+            logger.debug("writing row to result file: %s", row)
+            file.write(row)
     logger.debug("sending the stepper to initial position")
     stepper.move(table["pos"][0]-2000)
 
 
 def scan_computed(lia, pem, stepper, output_path, start_wl, stop_wl, integration_time=1):
+    wls = np.arange(start_wl, stop_wl+1, 1)
+    positions = compute_positions(wls)
+    pem_cmds = [pem_wl_cmd(wl) for wl in wls.tolist()]
     pem.enable_ret()
     with open(output_path, "w") as file:
-        for wl in range(start_wl, stop_wl+1, 1):
+        for wl, pos, pem_cmd in zip(wls.tolist(), positions.tolist(), pem_cmds):
             logger.info(f"beginning collection for {wl}nm")
-            wl_pem = f"0{wl}0"
-            pos = compute_pos(wl)
-            logger.debug(f"computed position {pos} for wavelength {wl}nm")
+            logger.debug("computed position %s for wavelength %snm", pos, wl)
             stepper.move(pos)
-            pem.set_wl(wl_pem)
-            sleep(0.5)  # let the signal settle before adjusting the phase
+            pem.set_wl_bytes(pem_cmd)
+            wait_for_settle(lia)  # let the signal settle before adjusting the phase
             lia.auto_phase()
-            samples = []
             logger.info("integrating")
-            time_start = time()
-            while (time() - time_start) < integration_time:
-                samples.append(lia.data_snapshot())
+            samples = collect_samples(lia, integration_time)
             logger.info("processing samples")
             signal, noise, dc = average_samples(samples)
-            result_line = f"{wl},{signal},{noise},{dc}\n"
-            logger.debug(f"writing line to result file: {result_line}")
-            file.write(result_line)
+            row = _ROW_FMT % (wl, signal, noise, dc)
+            logger.debug("writing row to result file: %s", row)
+            file.write(row)
     logger.debug("sending the stepper to initial position")
     stepper.move(compute_pos(start_wl)-2000)
 
 
-def interpolate_wl(target_wl, table):
-    if target_wl in table["wl"]:
-        i = table["wl"].index(target_wl)
-        return table["pos"][i]
-    for i in range(len(table["wl"])-1):
-        current_wl = table["wl"][i]
-        next_wl = table["wl"][i+1]
-        if (target_wl > current_wl) and (target_wl < next_wl):
-            current_pos = table["pos"][i]
-            next_pos = table["pos"][i+1]
-            slope = (next_pos - current_pos) / (next_wl - current_wl)
-            target_pos = floor(current_pos + (target_wl - current_wl) * slope)
-            return target_pos
+def wait_for_settle(lia, tolerance=0.01, max_reads=10, interval=0.02, min_wait=0.3):
+    # the LIA output lags the PEM retune by its 100 ms time constant, so two early readings
+    # can agree before the change has shown up at all; wait out three time constants first
+    sleep(min_wait)
+    # then poll R until two consecutive readings agree, giving up after about as long as
+    # the old fixed 0.5s wait
+    last = None
+    for _ in range(max_reads):
+        try:
+            current = lia.signal_mag()
+        except ValueError as e:
+            # a timed-out reading just means the signal hasn't been seen to settle yet
+            logger.debug("failed to read R while settling: %s", e)
+            last = None
+            sleep(interval)
+            continue
+        if (last is not None) and (abs(current - last) < tolerance * abs(current)):
+            logger.debug("signal settled at %.5e", current)
+            return
+        last = current
+        sleep(interval)
+    logger.debug("signal did not settle after %s readings, continuing anyway", max_reads)
+
+
+def collect_samples(lia, integration_time):
+    # one growing buffer of newline-separated snapshots instead of a list of small bytes objects
+    buf = bytearray()
+    snapshot = lia.data_snapshot
+    time_start = time()
+    while (time() - time_start) < integration_time:
+        try:
+            buf += snapshot()
+        except ValueError as e:
+            # data_snapshot() drains what's left of a short reply on the next call,
+            # so one slow reply only costs this sample rather than the whole run
+            logger.warning("[LIA] skipping snapshot: %s", e)
+            continue
+        buf += b"\n"
+    return buf
 
 
 def interpolate_pos(table, wl):
-    pos = 0
-    if wl in table["wl"]:
-        pos_index = table["wl"].index(wl)
-        pos = table["pos"][pos_index]
-    else:
-        for i, (wl_lower, wl_upper) in enumerate(zip(table["wl"], table["wl"][1:])):
-            if (wl > wl_lower) and (wl < wl_upper):
-                pos_lower = table["pos"][i]
-                pos_upper = table["pos"][i+1]
-                slope = (pos_upper - pos_lower) / (wl_upper - wl_lower)
-                wl_diff = wl - wl_lower
-                pos = floor(pos_lower + slope * wl_diff)
-                break
-    if pos == 0:
+    wls = table["wl"]
+    i = bisect_left(wls, wl)
+    if i < len(wls) and wls[i] == wl:
+        pos = table["pos"][i]
+    elif (i == 0) or (i == len(wls)):
         logger.error(f"[STEP] {wl}nm outside the calibration range")
         raise ValueError(f"{wl}nm outside of calibration range")
-    logger.debug(f"[STEP] interpolated position {pos} for {wl}nm")
+    else:
+        # integer floor of the linear interpolation between the neighbouring entries
+        pos_lower, pos_upper = table["pos"][i-1], table["pos"][i]
+        wl_lower, wl_upper = wls[i-1], wls[i]
+        wl_span = wl_upper - wl_lower
+        pos = (pos_lower * wl_span + (pos_upper - pos_lower) * (wl - wl_lower)) // wl_span
+    logger.debug("[STEP] interpolated position %s for %snm", pos, wl)
     return pos
 
 
+def interpolate_positions(table, wls):
+    # the positions don't change between scans, so callers can compute them once and reuse them
+    return {wl: interpolate_pos(table, wl) for wl in wls}
+
+
 def compute_pos(target_wl):
     def below_795(x):
         return floor(532.1996 * x - 3.6524)
@@ -397,24 +481,26 @@ def compute_pos(target_wl):
         return at_or_above_795(target_wl)
 
 
+def compute_positions(wls):
+    # same piecewise fit as compute_pos, evaluated for a whole array of wavelengths
+    positions = np.where(wls < 795, 532.1996 * wls - 3.6524, 194.8846 * wls - 97096)
+    return np.floor(positions).astype(np.int64)
+
+
 def average_samples(samples):
-    num_samples = len(samples)
-    logger.debug(f"computing average of {num_samples} samples")
-    ac_signals = np.ndarray(num_samples)
-    dc_signals = np.ndarray(num_samples)
-    for i, line in enumerate(samples):
-        ac, _, _, dc = line.strip().split(",")
-        ac_signals[i] = ac
-        dc_signals[i] = dc
-    avg_dc = dc_signals.mean()
-    ac_corrected = np.ndarray(num_samples)
-    for i, (ac, dc) in enumerate(zip(ac_signals, dc_signals)):
-        scale_factor = avg_dc / dc
-        ac_corrected[i] = ac * scale_factor
-    signal = ac_corrected.mean()
+    num_samples = samples.count(b"\n")
+    logger.debug("computing average of %s samples", num_samples)
+    # parse every snapshot in one pass, keeping only the X and IN3 columns
+    arr = np.loadtxt(io.BytesIO(samples), delimiter=",", usecols=(0, 3), dtype=np.float64, ndmin=2)
+    ac_signals = arr[:, 0]
+    dc_signals = arr[:, 1]
     dc = dc_signals.mean()
-    noise = ac_corrected.std()
-    logger.debug(f"signal = {signal:.5e}, noise = {noise:.5e}")
+    # scaling every AC sample by the same mean DC level commutes with the mean and std,
+    # so apply it to the two results rather than to the whole array
+    ratio = np.divide(ac_signals, dc_signals, out=ac_signals)
+    signal = dc * ratio.mean()
+    noise = abs(dc) * ratio.std()
+    logger.debug("signal = %.5e, noise = %.5e", signal, noise)
     return signal, noise, dc
 
 
@@ -439,6 +525,7 @@ def main(table_path, folder, stub, int_time, n, should_debug, start, stop, wl_of
     stepper = Stepper("COM5")
     data_dir = Path.cwd() / folder
     data_dir.mkdir(exist_ok=True)
+    positions = interpolate_positions(cal_table, range(795, 851, 1))
     scan_index = 0
     while True:
         if stub is not None:
@@ -449,11 +536,11 @@ def main(table_path, folder, stub, int_time, n, should_debug, start, stop, wl_of
         if (int_time is not None) and (int_time > 0):
             # scan(lia, pem, stepper, cal_table, path, integration_time=int_time)
             # scan_computed(lia, pem, stepper, path, 795, 860, integration_time=int_time)
-            scan_interpolated(lia, pem, stepper, cal_table, path, integration_time=int_time, wl_offset=wl_offset)
+            scan_interpolated(lia, pem, stepper, cal_table, path, integration_time=int_time, wl_offset=wl_offset, positions=positions)
         else:
             # scan(lia, pem, stepper, cal_table, path)
             # scan_computed(lia, pem, stepper, path, 795, 860)
-            scan_interpolated(lia, pem, stepper, cal_table, path, wl_offset=wl_offset)
+            scan_interpolated(lia, pem, stepper, cal_table, path, wl_offset=wl_offset, positions=positions)
         scan_index += 1
         if (n is not None) and (scan_index >= n):
             break
@@ -20,34 +20,31 @@ class Stepper:
 
     def _send(self, cmd, data):
         packet = struct.pack("<BBl", self.device, cmd, data)
-        logger.debug(f"[STEP] sending packet: {packet}")
+        logger.debug("[STEP] sending packet: %s", packet)
         self.ser.write(packet)
 
     def _recv(self):
         response = self.ser.read(6)
-        logger.debug(f"[STEP] received response: {response}")
+        logger.debug("[STEP] received response: %s", response)
         return response
 
     def move(self, target_pos):
-        logger.debug(f"[STEP] moving to {target_pos}")
+        logger.debug("[STEP] moving to %s", target_pos)
         self._send(StepperCmd.MOVE.value, target_pos)
-        logger.debug(f"[STEP] waiting until the destination is reached")
+        logger.debug("[STEP] waiting until the destination is reached")
         curr_pos = 0
         while curr_pos != target_pos:
             curr_pos = self.pos()
-            logger.debug(f"[STEP] still moving ({curr_pos} / {target_pos})")
+            logger.debug("[STEP] still moving (%s / %s)", curr_pos, target_pos)
         logger.debug("[STEP] done moving")
 
     def pos(self):
         logger.debug("[STEP] getting current position")
         self._send(StepperCmd.GETPOS.value, 0)
         resp = self._recv()
-        logger.debug(f"[STEP] received response: {resp}")
-        value = 256**3 * resp[5] + 256**2 * resp[4] + 256 * resp[3] + resp[2]
-        logger.debug(f"[STEP] translates to: {value}")
-        if resp[5] > 127:
-            value = -256**4
-            logger.debug(f"[STEP] setting value to {value}")
+        logger.debug("[STEP] received response: %s", resp)
+        value = struct.unpack_from("<i", resp, 2)[0]
+        logger.debug("[STEP] translates to: %s", value)
         return value
 
 